@@ -17,22 +17,18 @@
 
 import logging
 import os
-import random
+import re
 import shlex
-import shutil
-import signal
-import subprocess
 import sys
-from argparse import ArgumentParser, RawTextHelpFormatter
-from contextlib import nullcontext
+from argparse import SUPPRESS, Action, ArgumentParser, Namespace, RawTextHelpFormatter
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Iterator
 from dataclasses import dataclass
 from enum import Enum, auto
-from importlib.metadata import metadata
-from operator import attrgetter, itemgetter
+from functools import cache, lru_cache
+from operator import attrgetter
 from textwrap import dedent
-from typing import Optional
-
-import coloredlogs
+from typing import Optional, TextIO
 
 from sandwine._x11 import X11Display, X11Mode, create_x11_context, detect_and_require_nested_x11
 
@@ -54,37 +50,101 @@ class MountMode(Enum):
     TMPFS = auto()
 
 
-def parse_command_line(args: list[str], with_wine: bool):
-    distribution = metadata("sandwine")
+_BIND_MODES = frozenset({MountMode.BIND_RO, MountMode.BIND_RW, MountMode.BIND_DEV})
 
-    prog = "sandwine" if with_wine else "sand"
-    description = (
-        distribution["Summary"]
-        if with_wine
-        else "Command-line tool to run commands with bwrap/bubblewrap isolation"
-    )
+_BWRAP_FLAG_OF_TARGET_ONLY_MODE = {
+    MountMode.DEVTMPFS: "--dev",
+    MountMode.PROC: "--proc",
+    MountMode.TMPFS: "--tmpfs",
+}
+
+_BWRAP_FLAG_OF_SOURCE_TARGET_MODE = {
+    MountMode.BIND_DEV: "--dev-bind",
+    MountMode.BIND_RO: "--ro-bind",
+    MountMode.BIND_RW: "--bind",
+    MountMode.SYMLINK: "--symlink",
+}
+
+
+# NOTE: Module importlib.metadata is slow to import and reading package metadata
+#       is not free either, so both are deferred until actually needed.
+def get_summary() -> str:
+    from importlib.metadata import metadata
+
+    return metadata("sandwine")["Summary"]
+
+
+def get_version() -> str:
+    from importlib.metadata import version
+
+    return version("sandwine")
+
+
+# NOTE: Accepts a callable for a description, to be called when help is rendered
+class _LazyDescriptionArgumentParser(ArgumentParser):
+    def __init__(self, *args, description_thunk: Optional[Callable[[], str]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._description_thunk = description_thunk
+
+    def format_help(self) -> str:
+        if self._description_thunk is not None:
+            self.description = self._description_thunk()
+            self._description_thunk = None
+        return super().format_help()
 
-    usage = dedent(f"""\
-        usage: {prog} [OPTIONS] [--] PROGRAM [ARG ..]
-           or: {prog} [OPTIONS] --configure
-           or: {prog} --help
-           or: {prog} --version
-    """)[len("usage: ") :]
 
-    parser = ArgumentParser(
+# NOTE: Like action="version" but without the need to know the version upfront
+class _LazyVersionAction(Action):
+    def __init__(self, option_strings, dest=SUPPRESS, default=SUPPRESS, help=None):
+        super().__init__(
+            option_strings=option_strings, dest=dest, default=default, nargs=0, help=help
+        )
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        print(get_version())
+        parser.exit()
+
+
+_USAGE_TEMPLATE = dedent("""\
+    usage: {prog} [OPTIONS] [--] PROGRAM [ARG ..]
+       or: {prog} [OPTIONS] --configure
+       or: {prog} --help
+       or: {prog} --version
+""")[len("usage: ") :]
+
+_EPILOG = dedent("""\
+    Software libre licensed under GPL v3 or later.
+    Brought to you by Sebastian Pipping <sebastian@pipping.org>.
+
+    Please report bugs at https://github.com/hartwork/sandwine — thank you!
+""")
+
+
+# NOTE: Cached so that repeated parsing (e.g. when used as a library) builds each parser once
+@lru_cache(maxsize=2)
+def _build_parser(with_wine: bool) -> ArgumentParser:
+    prog = "sandwine" if with_wine else "sand"
+    description: Optional[str]
+    description_thunk: Optional[Callable[[], str]]
+    if with_wine:
+        description = None
+        description_thunk = get_summary
+    else:
+        description = "Command-line tool to run commands with bwrap/bubblewrap isolation"
+        description_thunk = None
+
+    parser = _LazyDescriptionArgumentParser(
         prog=prog,
-        usage=usage,
+        usage=_USAGE_TEMPLATE.format(prog=prog),
         description=description,
+        description_thunk=description_thunk,
         formatter_class=RawTextHelpFormatter,
-        epilog=dedent("""\
-            Software libre licensed under GPL v3 or later.
-            Brought to you by Sebastian Pipping <sebastian@pipping.org>.
-
-            Please report bugs at https://github.com/hartwork/sandwine — thank you!
-        """),
+        epilog=_EPILOG,
     )
 
-    parser.add_argument("--version", action="version", version=distribution["Version"])
+    parser.add_argument(
+        "--version", action=_LazyVersionAction, help="show program's version number and exit"
+    )
 
     program = parser.add_argument_group("positional arguments")
     program.add_argument("argv_0", metavar="PROGRAM", nargs="?", help="command to run")
@@ -215,52 +275,132 @@ def parse_command_line(args: list[str], with_wine: bool):
         " (default: run command once)",
     )
 
-    return parser.parse_args(args)
+    return parser
+
+
+def parse_command_line(args: list[str], with_wine: bool):
+    # NOTE: Plain "--version" is answered without building the parser
+    if args == ["--version"]:
+        print(get_version())
+        sys.exit(0)
+
+    return _build_parser(with_wine).parse_args(args)
+
+
+# NOTE: Same set of characters that shlex.quote leaves unquoted
+_is_shell_safe = re.compile(r"[\w@%+=:,./-]+", re.ASCII).fullmatch
+
+
+def shell_quote(arg: str) -> str:
+    return arg if _is_shell_safe(arg) else shlex.quote(arg)
 
 
 class ArgvBuilder:
-    def __init__(self):
-        self._groups = []
+    def __init__(self) -> None:
+        self._groups: list[tuple[str, ...]] = []
+        self._flat: list[str] = []
 
-    def add(self, *args):
+    def add(self, *args: str) -> None:
         if not args:
             return
         self._groups.append(args)
+        self._flat.extend(args)
+
+    def iter_flat(self) -> Iterator[str]:
+        return iter(self._flat)
 
-    def iter_flat(self):
-        for group in self._groups:
-            yield from group
+    def as_list(self) -> list[str]:
+        return self._flat
 
-    def iter_groups(self):
+    def iter_groups(self) -> Iterator[tuple[str, ...]]:
         yield from self._groups
 
-    def announce_to(self, target):
+    def announce_to(self, target: TextIO) -> None:
+        # NOTE: Collected upfront so that target sees a single write
+        lines = []
         for i, group in enumerate(self._groups):
             prefix = "# " if (i == 0) else " " * 4
-            flat_args = shlex.join(group)
+            flat_args = " ".join([shell_quote(arg) for arg in group])
             suffix = "" if (i == len(self._groups) - 1) else " \\"
-            print(f"{prefix}{flat_args}{suffix}", file=target)
+            lines.append(f"{prefix}{flat_args}{suffix}\n")
+        target.write("".join(lines))
+
+
+# NOTE: Honors ${HOME} first and falls back to the password database
+@cache
+def get_home() -> str:
+    return os.path.expanduser("~")
+
+
+def no_trailing_sep(path: str) -> str:
+    return path.rstrip(os.sep) or os.sep
+
+
+def is_at_or_below_any(path: str, dir_paths_without_trailing_sep: set[str]) -> bool:
+    # NOTE: Walks up the ancestors of path rather than scanning all of dir_paths
+    while True:
+        if path in dir_paths_without_trailing_sep:
+            return True
+        parent_path = os.path.dirname(path)
+        if parent_path == path:
+            return False
+        path = parent_path
+
+
+def find_existing_paths(paths: Iterable[str]) -> set[str]:
+    # NOTE: Paths sharing a parent directory are checked using a single
+    #       os.scandir of that directory rather than one stat(2) each.
+    existing_paths = set()
+    paths_of_parent = defaultdict(list)
+    for path in paths:
+        # NOTE: Only paths that need no textual resolution of "..", "." or trailing
+        #       separators can be batched: the kernel follows symlinks before applying
+        #       "..", and "file/" does not exist even if "file" does.
+        if os.path.isabs(path) and path == os.path.normpath(path):
+            paths_of_parent[os.path.dirname(path)].append(path)
+        elif os.path.exists(path):
+            existing_paths.add(path)
+
+    for parent_path, child_paths in paths_of_parent.items():
+        entry_of_name = None
+        if len(child_paths) > 1:
+            try:
+                with os.scandir(parent_path) as entries:
+                    entry_of_name = {entry.name: entry for entry in entries}
+            except OSError:  # e.g. no permission to list, only to traverse
+                pass
+
+        for path in child_paths:
+            name = os.path.basename(path)
+            if entry_of_name is None or not name:
+                exists = os.path.exists(path)
+            else:
+                entry = entry_of_name.get(name)
+                # NOTE: Symlinks could be dangling so they need following
+                exists = entry is not None and (not entry.is_symlink() or os.path.exists(path))
+
+            if exists:
+                existing_paths.add(path)
 
+    return existing_paths
 
-def single_trailing_sep(path):
-    return path.rstrip(os.sep) + os.sep
 
+def parse_path_colon_access(candidate: str) -> tuple[str, AccessMode]:
+    path, colon, access_mode_candidate = candidate.rpartition(":")
+    if colon:
+        if access_mode_candidate == "ro":
+            return path, AccessMode.READ_ONLY
+        elif access_mode_candidate == "rw":
+            return path, AccessMode.READ_WRITE
 
-def parse_path_colon_access(candidate):
-    error_message = f'Value {candidate!r} does not match pattern "PATH:{{ro,rw}}".'
-    if ":" not in candidate:
-        raise ValueError(error_message)
+    raise ValueError(f'Value {candidate!r} does not match pattern "PATH:{{ro,rw}}".')
 
-    path, access_mode_candidate = candidate.rsplit(":", 1)
-    if access_mode_candidate == "ro":
-        return path, AccessMode.READ_ONLY
-    elif access_mode_candidate == "rw":
-        return path, AccessMode.READ_WRITE
 
-    raise ValueError(error_message)
+# NOTE: Parameter "slots" needs Python >=3.10 (and we support 3.9)
+_DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
 
 
-@dataclass
+@dataclass(**_DATACLASS_SLOTS)
 class MountTask:
     mode: MountMode
     target: str
@@ -269,21 +409,60 @@ class MountTask:
 
 
 def infer_mount_task(mode: MountMode, abs_target_path: str, required: bool = True) -> MountTask:
-    if os.path.islink(abs_target_path):
-        mode = MountMode.SYMLINK
+    # NOTE: One readlink(2) rather than lstat(2) followed by readlink(2)
+    try:
         source = os.readlink(abs_target_path)
-    else:
+    except OSError:  # i.e. not a symlink (or not existing)
         source = None
+    else:
+        mode = MountMode.SYMLINK
 
     return MountTask(mode=mode, target=abs_target_path, source=source, required=required)
 
 
-def random_hostname():
-    return "".join(hex(random.randint(0, 15))[2:] for _ in range(12))
+def bind_mount_mode_for(access_mode: AccessMode) -> MountMode:
+    if access_mode == AccessMode.READ_WRITE:
+        return MountMode.BIND_RW
+    return MountMode.BIND_RO
+
+
+# NOTE: Returns whether a fresh ~/.wine/ was created (that winecfg needs to populate)
+def add_dotwine_mount_task(config: Namespace, mount_tasks: list[MountTask], my_home: str) -> bool:
+    dotwine_target_path = os.path.join(my_home, ".wine")
+
+    if config.dotwine is None:
+        if config.with_wine:
+            mount_tasks.append(MountTask(MountMode.TMPFS, dotwine_target_path))
+        return False
+
+    dotwine_source_path, dotwine_access = parse_path_colon_access(config.dotwine)
+    mount_tasks.append(
+        MountTask(
+            bind_mount_mode_for(dotwine_access), dotwine_target_path, source=dotwine_source_path
+        )
+    )
+
+    if os.path.exists(dotwine_source_path):
+        return False
 
+    _logger.info(f"Creating directory {dotwine_source_path!r}...")
+    os.makedirs(dotwine_source_path, mode=0o700, exist_ok=True)
+    return True
 
-def create_bwrap_argv(config):
-    my_home = os.path.expanduser("~")
+
+def create_extra_bind_mount_task(bind: str) -> MountTask:
+    mount_target, mount_access = parse_path_colon_access(bind)
+    return MountTask(bind_mount_mode_for(mount_access), os.path.abspath(mount_target))
+
+
+def random_hostname() -> str:
+    return os.urandom(6).hex()
+
+
+def create_bwrap_argv(config: Namespace) -> ArgvBuilder:
+    import shutil
+
+    my_home = get_home()
     mount_tasks = [
         MountTask(MountMode.TMPFS, "/"),
         MountTask(MountMode.BIND_RO, "/bin"),
@@ -299,7 +478,7 @@ def create_bwrap_argv(config):
         MountTask(MountMode.BIND_RO, "/usr"),
         MountTask(MountMode.TMPFS, my_home),
     ]
-    env_tasks = {var: None for var in ["HOME", "TERM", "USER", "WINEDEBUG"]}
+    env_tasks = dict.fromkeys(["HOME", "TERM", "USER", "WINEDEBUG"])
     env_tasks["container"] = "sandwine"
     unshare_args = ["--unshare-user", "--unshare-all"]
 
@@ -317,48 +496,32 @@ def create_bwrap_argv(config):
     # Networking
     if config.network:
         unshare_args += ["--share-net"]
-        mount_tasks += [
-            MountTask(MountMode.BIND_RO, "/run/NetworkManager/resolv.conf", required=False),
-            MountTask(MountMode.BIND_RO, "/run/systemd/resolve/stub-resolv.conf", required=False),
-        ]
+        mount_tasks.extend(
+            [
+                MountTask(MountMode.BIND_RO, "/run/NetworkManager/resolv.conf", required=False),
+                MountTask(
+                    MountMode.BIND_RO, "/run/systemd/resolve/stub-resolv.conf", required=False
+                ),
+            ]
+        )
 
     # Sound
     if config.pulseaudio:
         pulseaudio_socket = f"/run/user/{os.getuid()}/pulse/native"
         env_tasks["PULSE_SERVER"] = f"unix:{pulseaudio_socket}"
-        mount_tasks += [MountTask(MountMode.BIND_RW, pulseaudio_socket)]
+        mount_tasks.append(MountTask(MountMode.BIND_RW, pulseaudio_socket))
 
     # X11
-    if X11Mode(config.x11) != X11Mode.NONE:
+    x11_unix_socket = None
+    if config.x11 is not X11Mode.NONE:
         x11_unix_socket = X11Display(config.x11_display_number).get_unix_socket()
-        mount_tasks += [MountTask(MountMode.BIND_RW, x11_unix_socket)]
+        mount_tasks.append(MountTask(MountMode.BIND_RW, x11_unix_socket))
         env_tasks["DISPLAY"] = f":{config.x11_display_number}"
 
     # Wine
-    run_winecfg = X11Mode(config.x11) != X11Mode.NONE and (
-        config.configure or config.dotwine is None
-    )
-    dotwine_target_path = os.path.expanduser("~/.wine")
-    if config.dotwine is not None:
-        dotwine_source_path, dotwine_access = parse_path_colon_access(config.dotwine)
-
-        if dotwine_access == AccessMode.READ_WRITE:
-            mount_mode = MountMode.BIND_RW
-        else:
-            mount_mode = MountMode.BIND_RO
-
-        mount_tasks += [MountTask(mount_mode, dotwine_target_path, source=dotwine_source_path)]
-
-        if not os.path.exists(dotwine_source_path):
-            _logger.info(f"Creating directory {dotwine_source_path!r}...")
-            os.makedirs(dotwine_source_path, mode=0o700, exist_ok=True)
-            run_winecfg = True
-
-        del dotwine_source_path
-        del dotwine_access
-    elif config.with_wine:
-        mount_tasks += [MountTask(MountMode.TMPFS, dotwine_target_path)]
-    del dotwine_target_path
+    run_winecfg = config.x11 is not X11Mode.NONE and (config.configure or config.dotwine is None)
+    if add_dotwine_mount_task(config, mount_tasks, my_home):
+        run_winecfg = True
 
     # More Wine: Mount the place that upstream's Debian packages installed to
     #            if(!) that's the Wine we'll be running
@@ -370,32 +533,23 @@ def create_bwrap_argv(config):
             "/opt/wine-staging/",
         ):
             if resolved_wine_bin_abs_path.startswith(wine_opt_prefix):
-                mount_tasks += [MountTask(MountMode.BIND_RO, wine_opt_prefix.rstrip("/"))]
+                mount_tasks.append(MountTask(MountMode.BIND_RO, wine_opt_prefix.rstrip("/")))
                 break
 
     # Extra binds
-    for bind in config.extra_binds:
-        mount_target_orig, mount_access = parse_path_colon_access(bind)
-        mount_target = os.path.abspath(mount_target_orig)
-        del mount_target_orig
-        if mount_access == AccessMode.READ_WRITE:
-            mount_mode = MountMode.BIND_RW
-        else:
-            mount_mode = MountMode.BIND_RO
-        mount_tasks += [MountTask(mount_mode, mount_target)]
-        del mount_target, mount_access
+    mount_tasks.extend(create_extra_bind_mount_task(bind) for bind in config.extra_binds)
 
     # Program
     if os.sep in (config.argv_0 or ""):
         real_argv_0 = os.path.abspath(config.argv_0)
-        mount_tasks += [
-            MountTask(MountMode.BIND_RO, real_argv_0, required=False),
-        ]
-        if config.with_wine:
-            mount_tasks += [
-                MountTask(MountMode.BIND_RO, real_argv_0 + ".exe", required=False),
-                MountTask(MountMode.BIND_RO, real_argv_0 + ".EXE", required=False),
-            ]
+        mount_tasks.append(MountTask(MountMode.BIND_RO, real_argv_0, required=False))
+        if config.with_wine and not real_argv_0.lower().endswith(".exe"):
+            mount_tasks.extend(
+                [
+                    MountTask(MountMode.BIND_RO, real_argv_0 + ".exe", required=False),
+                    MountTask(MountMode.BIND_RO, real_argv_0 + ".EXE", required=False),
+                ]
+            )
 
     # Linux Namespaces
     argv.add(*unshare_args)
@@ -404,30 +558,26 @@ def create_bwrap_argv(config):
     sorted_mount_tasks = sorted(mount_tasks, key=attrgetter("target"))
     del mount_tasks
 
+    existing_sources = find_existing_paths(
+        mount_task.source or mount_task.target
+        for mount_task in sorted_mount_tasks
+        if mount_task.mode in _BIND_MODES
+    )
+
+    bind_targets = set()  # i.e. for filtering ${PATH} further down
     for mount_task in sorted_mount_tasks:
-        if mount_task.mode == MountMode.TMPFS:
-            argv.add("--tmpfs", mount_task.target)
-        elif mount_task.mode == MountMode.DEVTMPFS:
-            argv.add("--dev", mount_task.target)
-        elif mount_task.mode == MountMode.PROC:
-            argv.add("--proc", mount_task.target)
-        elif mount_task.mode in (
-            MountMode.BIND_RO,
-            MountMode.BIND_RW,
-            MountMode.BIND_DEV,
-            MountMode.SYMLINK,
-        ):
+        if (flag := _BWRAP_FLAG_OF_TARGET_ONLY_MODE.get(mount_task.mode)) is not None:
+            argv.add(flag, mount_task.target)
+        elif (flag := _BWRAP_FLAG_OF_SOURCE_TARGET_MODE.get(mount_task.mode)) is not None:
             if mount_task.source is None:
                 mount_task.source = mount_task.target
 
             # NOTE: The X11 Unix socket will only show up later
-            keep_missing_source = (
-                X11Mode(config.x11) != X11Mode.NONE and mount_task.target == x11_unix_socket
-            )
+            keep_missing_source = mount_task.target == x11_unix_socket
 
             if (
                 mount_task.mode != MountMode.SYMLINK
-                and not os.path.exists(mount_task.source)
+                and mount_task.source not in existing_sources
                 and not keep_missing_source
             ):
                 if mount_task.required:
@@ -442,32 +592,23 @@ def create_bwrap_argv(config):
                     )
                     continue
 
-            if mount_task.mode == MountMode.BIND_RO:
-                argv.add("--ro-bind", mount_task.source, mount_task.target)
-            elif mount_task.mode == MountMode.BIND_RW:
-                argv.add("--bind", mount_task.source, mount_task.target)
-            elif mount_task.mode == MountMode.BIND_DEV:
-                argv.add("--dev-bind", mount_task.source, mount_task.target)
-            elif mount_task.mode == MountMode.SYMLINK:
-                argv.add("--symlink", mount_task.source, mount_task.target)
-            else:
-                assert False, f"Mode {mount_task.mode} not supported"
+            argv.add(flag, mount_task.source, mount_task.target)
+
+            if mount_task.mode in _BIND_MODES:
+                bind_targets.add(no_trailing_sep(mount_task.target))
         else:
             assert False, f"Mode {mount_task.mode} unknown"
 
     # Filter ${PATH}
     candidate_paths = os.environ["PATH"].split(os.pathsep)
     candidate_paths.append("/usr/lib/wine")  # for wineserver on e.g. Debian
-    available_paths = []
-    for candidate_path in candidate_paths:
+    available_paths: dict[str, None] = {}  # i.e. an ordered set
+    for candidate_path in dict.fromkeys(candidate_paths):  # i.e. without duplicates
         candidate_path = os.path.realpath(candidate_path)
-        for mount_task in reversed(sorted_mount_tasks):
-            if single_trailing_sep(candidate_path).startswith(
-                single_trailing_sep(mount_task.target)
-            ):
-                if mount_task.mode in (MountMode.BIND_RO, MountMode.BIND_RW, MountMode.BIND_DEV):
-                    available_paths.append(candidate_path)
-                    break
+        if candidate_path in available_paths:
+            continue
+        if is_at_or_below_any(candidate_path, bind_targets):
+            available_paths[candidate_path] = None
         else:
             _logger.debug(
                 f"Path {candidate_path!r} will not exist in sandbox mount stack"
@@ -477,7 +618,8 @@ def create_bwrap_argv(config):
 
     # Create environment (meaning environment variables)
     argv.add("--clearenv")
-    for env_var, env_value in sorted(env_tasks.items(), key=itemgetter(0)):
+    for env_var in sorted(env_tasks):
+        env_value = env_tasks[env_var]
         if env_value is None:
             env_value = os.environ.get(env_var)
             if env_value is None:
@@ -486,16 +628,30 @@ def create_bwrap_argv(config):
 
     argv.add("--")
 
-    # Wrap with wineserver (for clean shutdown, it defaults to 3 seconds timeout)
-    if config.with_wine:
-        argv.add("sh", "-c", 'wineserver -p0 && "$0" "$@" ; ret=$? ; wineserver -k ; exit ${ret}')
-
-    # Add winecfg
-    if run_winecfg and config.with_wine:
-        argv.add("sh", "-c", 'winecfg && exec "$0" "$@"')
+    # NOTE: All of wineserver, winecfg and second try share a single shell
+    #       (rather than one nested shell each) to save on process creation.
+    run_program = '"$0" "$@"'
 
     # Add second try
     if config.second_try:
+        run_program = f"{{ {run_program} || {run_program} ; }}"
+
+    if config.with_wine:
+        shell_commands = ["wineserver -p0"]
+
+        # Add winecfg
+        if run_winecfg:
+            shell_commands.append("winecfg")
+
+        shell_commands.append(run_program)
+
+        # Wrap with wineserver (for clean shutdown, it defaults to 3 seconds timeout)
+        argv.add(
+            "sh",
+            "-c",
+            " && ".join(shell_commands) + " ; ret=$? ; wineserver -k ; exit ${ret}",
+        )
+    elif config.second_try:
         argv.add("sh", "-c", '"$0" "$@" || exec "$0" "$@"')
 
     # Add Wine and PTY
@@ -522,31 +678,138 @@ def create_bwrap_argv(config):
     return argv
 
 
-def require_recent_bubblewrap():
+def get_cache_dir() -> str:
+    # NOTE: The XDG Base Directory Specification requires ignoring relative paths
+    cache_home = os.environ.get("XDG_CACHE_HOME", "")
+    if not os.path.isabs(cache_home):
+        cache_home = os.path.join(get_home(), ".cache")
+    return os.path.join(cache_home, "sandwine")
+
+
+def get_bubblewrap_fingerprint() -> Optional[str]:
+    import shutil
+
+    bwrap_abs_path = shutil.which("bwrap")
+    if bwrap_abs_path is None:
+        return None
+    try:
+        stat_result = os.stat(bwrap_abs_path)
+    except OSError:
+        return None
+    return f"{bwrap_abs_path}:{stat_result.st_ino}:{stat_result.st_size}:{stat_result.st_mtime_ns}"
+
+
+def require_recent_bubblewrap() -> None:
+    # NOTE: A passed check is remembered per bwrap binary
+    #       to save running bwrap (i.e. fork and exec) every time.
+    bwrap_fingerprint = get_bubblewrap_fingerprint()
+    cache_path = os.path.join(get_cache_dir(), "bwrap_ok")
+    if bwrap_fingerprint is not None:
+        try:
+            with open(cache_path) as f:
+                if f.read() == bwrap_fingerprint:
+                    return
+        except OSError:
+            pass
+
+    import subprocess
+
     argv = ["bwrap", "--disable-userns", "--help"]
     if subprocess.call(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) != 0:
         _logger.error("sandwine requires bubblewrap >=0.8.0" ", aborting.")
         sys.exit(1)
 
+    if bwrap_fingerprint is not None:
+        try:
+            os.makedirs(os.path.dirname(cache_path), mode=0o700, exist_ok=True)
+        except OSError:
+            return  # i.e. no caching this time, but no harm done
+
+        temp_cache_path = f"{cache_path}.{os.getpid()}"
+        try:
+            with open(temp_cache_path, "w") as f:
+                f.write(bwrap_fingerprint)
+            os.replace(temp_cache_path, cache_path)  # i.e. atomically
+        except OSError:
+            # NOTE: No caching this time, but no leftovers piling up either
+            try:
+                os.unlink(temp_cache_path)
+            except OSError:
+                pass
+
+
+def run_command(argv: list[str]) -> int:
+    import subprocess
+
+    try:
+        return subprocess.call(argv)
+    except FileNotFoundError:
+        _logger.error(f"Command {argv[0]!r} is not available, aborting.")
+        return 127
+
+
+# NOTE: Replaces the Python process (rather than waiting for a child) and hence
+#       only returns on error; not an option when nested X11 needs shutting down later.
+def exec_command(argv: list[str]) -> int:
+    import signal
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    # NOTE: CPython ignores SIGPIPE and SIGXFSZ at startup. subprocess.call resets them
+    #       in the child (restore_signals=True) but os.execvp does not, and signals that
+    #       are ignored on entry cannot be reset by a non-interactive sh later on, so
+    #       e.g. "sandwine [..] -- prog | head" would no longer end prog by SIGPIPE.
+    previous_handlers = {}
+    for signal_name in ("SIGPIPE", "SIGXFSZ"):
+        signal_number = getattr(signal, signal_name, None)
+        if signal_number is not None:
+            previous_handlers[signal_number] = signal.signal(signal_number, signal.SIG_DFL)
+
+    # NOTE: Like close_fds=True of subprocess.call: Neither bwrap nor script(1) close
+    #       descriptors inherited from our caller, so any of them left open here would
+    #       end up inside the sandbox, e.g. a directory handle outside of the mount stack.
+    os.closerange(3, os.sysconf("SC_OPEN_MAX"))
+
+    try:
+        os.execvp(argv[0], argv)
+    except FileNotFoundError:
+        _logger.error(f"Command {argv[0]!r} is not available, aborting.")
+        return 127
+    finally:  # i.e. only reached if the exec failed
+        for signal_number, handler in previous_handlers.items():
+            signal.signal(signal_number, handler)
+
 
 def _inner_main(with_wine: bool):
+    import signal
+
     exit_code = 0
     try:
         config = parse_command_line(sys.argv[1:], with_wine=with_wine)
 
-        coloredlogs.install(level=logging.DEBUG)
+        if sys.stderr.isatty():
+            import coloredlogs
+
+            coloredlogs.install(level=logging.DEBUG)
+        else:
+            # NOTE: No colors to show, so no need to import coloredlogs
+            logging.basicConfig(
+                level=logging.DEBUG,
+                format="%(asctime)s %(name)s[%(process)d] %(levelname)s %(message)s",
+            )
 
         require_recent_bubblewrap()
 
-        if X11Mode(config.x11) != X11Mode.NONE:
-            if X11Mode(config.x11) == X11Mode.AUTO:
+        if config.x11 is not X11Mode.NONE:
+            if config.x11 is X11Mode.AUTO:
                 config.x11 = detect_and_require_nested_x11()
 
-            if X11Mode(config.x11) == X11Mode.HOST:
+            if config.x11 is X11Mode.HOST:
                 config.x11_display_number = X11Display.find_used()
             else:
                 minimum = 0
-                if X11Mode(config.x11) == X11Mode.XPRA:
+                if config.x11 is X11Mode.XPRA:
                     minimum = 10  # Avoids warning from Xpra for displays <=9
                 config.x11_display_number = X11Display.find_unused(minimum)
 
@@ -554,19 +817,18 @@ def _inner_main(with_wine: bool):
 
             x11context = create_x11_context(config.x11, config.x11_display_number, 1024, 768)
         else:
-            x11context = nullcontext()
+            x11context = None
 
         argv_builder = create_bwrap_argv(config)
         argv_builder.announce_to(sys.stderr)
 
-        argv = list(argv_builder.iter_flat())
+        argv = argv_builder.as_list()
 
-        with x11context:
-            try:
-                exit_code = subprocess.call(argv)
-            except FileNotFoundError:
-                _logger.error(f"Command {argv[0]!r} is not available, aborting.")
-                exit_code = 127
+        if x11context is None:
+            exit_code = exec_command(argv)
+        else:
+            with x11context:
+                exit_code = run_command(argv)
 
     except KeyboardInterrupt:
         exit_code = 128 + signal.SIGINT
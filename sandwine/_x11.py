@@ -15,28 +15,94 @@
 # You should have received a copy of the GNU General Public License along
 # with sandwine. If not, see <https://www.gnu.org/licenses/>.
 
-import glob
 import logging
 import os
-import shutil
-import signal
-import subprocess
 import sys
-import tempfile
-import time
 from abc import ABC, abstractmethod
 from contextlib import nullcontext
 from enum import Enum
+from functools import cache
 from textwrap import dedent
 
 _logger = logging.getLogger(__name__)
 
+# NOTE: These are from <sys/inotify.h>
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+
+
+def _create_inotify_fd(directory: str, mask: int) -> int:
+    import ctypes
+
+    libc = ctypes.CDLL(None, use_errno=True)
+
+    fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+    if fd == -1:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+    if libc.inotify_add_watch(fd, os.fsencode(directory), mask) == -1:
+        errno = ctypes.get_errno()
+        os.close(fd)
+        raise OSError(errno, os.strerror(errno), directory)
+
+    return fd
+
+
+def _drain_fd(fd: int) -> None:
+    try:
+        while os.read(fd, 4096):
+            pass
+    except BlockingIOError:
+        pass
+
+
+def _poll_until_file_present(filename):
+    import time
 
-def _wait_until_file_present(filename):
     while not os.path.exists(filename):
         time.sleep(0.5)
 
 
+def _wait_until_file_present(filename):
+    try:
+        inotify_fd = _create_inotify_fd(os.path.dirname(filename), _IN_CREATE | _IN_MOVED_TO)
+    except (AttributeError, OSError):  # e.g. no inotify or directory missing
+        _poll_until_file_present(filename)
+        return
+
+    import select
+
+    try:
+        # NOTE: The watch is in place before the first check so that
+        #       we cannot miss creation of the file in between.
+        while not os.path.exists(filename):
+            # NOTE: The timeout is a safety net for events we cannot see,
+            #       e.g. the directory being deleted and re-created.
+            if select.select([inotify_fd], [], [], 0.5)[0]:
+                _drain_fd(inotify_fd)
+    finally:
+        os.close(inotify_fd)
+
+
+def _wait_until_unix_socket_connectable(filename):
+    import socket
+    import time
+
+    while True:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            if sock.connect_ex(filename) == 0:
+                return
+        time.sleep(0.05)
+
+
+@cache
+def _which(command):
+    import shutil
+
+    return shutil.which(command)
+
+
 class X11Mode(Enum):
     AUTO = "auto"
     HOST = "host"
@@ -48,8 +114,10 @@ class X11Mode(Enum):
     NONE = "none"
 
     @staticmethod
+    @cache
     def values():
-        return [x.value for x in X11Mode.__members__.values()]
+        # NOTE: A tuple so that the cached result cannot be mutated by callers
+        return tuple(x.value for x in X11Mode.__members__.values())
 
 
 class X11Display:
@@ -65,9 +133,21 @@ class X11Display:
 
     @staticmethod
     def find_unused(minimum: int = 0) -> int:
-        used_displays = {int(os.path.basename(p)[1:]) for p in glob.glob("/tmp/.X11-unix/X*")}
-        candidate_displays = set(list(range(len(used_displays))) + [len(used_displays)] + [minimum])
-        return sorted(candidate_displays - used_displays)[-1]
+        used_displays = set()
+        try:
+            with os.scandir("/tmp/.X11-unix") as entries:
+                for entry in entries:
+                    if entry.name.startswith("X") and entry.name[1:].isdecimal():
+                        used_displays.add(int(entry.name[1:]))
+        except FileNotFoundError:
+            pass
+
+        # NOTE: Starting at len(used_displays) rather than at minimum alone
+        #       skips past the densely used low display numbers right away.
+        candidate = max(minimum, len(used_displays))
+        while candidate in used_displays:
+            candidate += 1
+        return candidate
 
     @staticmethod
     def find_used() -> int:
@@ -91,7 +171,7 @@ class _X11Context(ABC):
 
     @classmethod
     def is_available(cls):
-        return shutil.which(cls._command) is not None
+        return _which(cls._command) is not None
 
     @abstractmethod
     def __enter__(self):
@@ -108,6 +188,8 @@ class _SimpleX11Context(_X11Context):
         self._process = None
 
     def __enter__(self):
+        import subprocess
+
         _logger.info(self._message_starting)
 
         argv = self._create_argv()
@@ -122,6 +204,8 @@ class _SimpleX11Context(_X11Context):
         _logger.info(self._message_started)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        import signal
+
         if self._process is not None:
             _logger.info(self._message_stopping)
             self._process.send_signal(signal.SIGINT)
@@ -169,6 +253,31 @@ class XnestX11Context(_SimpleX11Context):
         return [self._command, "-geometry", self._geometry, f":{self._display_number}"]
 
 
+_XVFB_WRAPPER_SCRIPT = dedent("""\
+    #! /usr/bin/env bash
+    set -e
+    args=(
+        +extension GLX
+        +extension Composite
+        # NOTE: Extension MIT-SHM is disabled because it kept crashing Xephyr 21.1.7
+        #       and nxagent/X2Go 4.1.0.3 when moving windows around near screen edges.
+        -extension MIT-SHM
+        # NOTE: This is the Xpra default, 1024x768x24+32 was rejected in practice.
+        -screen 0 8192x4096x24+32
+        -nolisten tcp
+        -noreset
+        # NOTE: We are trying to protect the host from the app,
+        #       *not* the app from the host.
+        # -auth [..]
+        -dpi 96
+        "$@"
+    )
+    PS4='# '
+    set -x
+    exec Xvfb "${args[@]}"
+""").encode()
+
+
 class XpraContext(_X11Context):
     _command = "xpra"
 
@@ -180,36 +289,21 @@ class XpraContext(_X11Context):
 
     @staticmethod
     def _write_xvfh_wrapper_script_to(xvfb_wrapper_path):
-        with open(xvfb_wrapper_path, "w") as f:
-            print(
-                dedent("""\
-                #! /usr/bin/env bash
-                set -e
-                args=(
-                    +extension GLX
-                    +extension Composite
-                    # NOTE: Extension MIT-SHM is disabled because it kept crashing Xephyr 21.1.7
-                    #       and nxagent/X2Go 4.1.0.3 when moving windows around near screen edges.
-                    -extension MIT-SHM
-                    # NOTE: This is the Xpra default, 1024x768x24+32 was rejected in practice.
-                    -screen 0 8192x4096x24+32
-                    -nolisten tcp
-                    -noreset
-                    # NOTE: We are trying to protect the host from the app,
-                    #       *not* the app from the host.
-                    # -auth [..]
-                    -dpi 96
-                    "$@"
-                )
-                PS4='# '
-                set -x
-                exec Xvfb "${args[@]}"
-            """),
-                file=f,
-            )
-            os.fchmod(f.fileno(), 0o755)  # i.e. make executable
+        fd = os.open(xvfb_wrapper_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o755)
+        try:
+            os.write(fd, _XVFB_WRAPPER_SCRIPT)
+            os.fchmod(fd, 0o755)  # i.e. make executable, regardless of umask
+        finally:
+            os.close(fd)
 
     def _wait_for_connectable_xpra_server(self, unix_socket_path: str) -> None:
+        import subprocess
+        import time
+
+        # NOTE: A plain connect is far cheaper than forking "xpra id" but only proves
+        #       that the server is listening, so "xpra id" still has the final say.
+        _wait_until_unix_socket_connectable(unix_socket_path)
+
         while True:
             ret = subprocess.call(
                 [self._command, "id", unix_socket_path],
@@ -221,6 +315,9 @@ class XpraContext(_X11Context):
             time.sleep(0.5)
 
     def __enter__(self):
+        import subprocess
+        import tempfile
+
         _logger.info(self._message_starting)
 
         self._tempdir = tempfile.TemporaryDirectory()
@@ -292,13 +389,22 @@ class XpraContext(_X11Context):
         _logger.info(self._message_started)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        import signal
+
         _logger.info(self._message_stopping)
 
-        for process in (self._client_process, self._server_process):
-            if process is None:
-                continue
+        processes = [
+            process
+            for process in (self._client_process, self._server_process)
+            if process is not None
+        ]
+
+        # NOTE: All processes are signalled before waiting on any of them
+        #       so that they shut down in parallel rather than one by one.
+        for process in processes:
             # NOTE: Using SIGTERM only because SIGINT showed backtrace output
             process.send_signal(signal.SIGTERM)
+        for process in processes:
             process.wait()
 
         self._tempdir.__exit__(None, None, None)
@@ -343,20 +449,21 @@ def detect_and_require_nested_x11() -> X11Mode:
     sys.exit(127)
 
 
-def create_x11_context(mode: X11Mode, display_number: int, width: int, height: int):
-    init_args = dict(display_number=display_number, width=width, height=height)
+_CONTEXT_CLASS_OF_MODE: dict[X11Mode, type[_X11Context]] = {
+    X11Mode.NXAGENT: NxagentContext,
+    X11Mode.XEPHYR: XephyrX11Context,
+    X11Mode.XNEST: XnestX11Context,
+    X11Mode.XPRA: XpraContext,
+    X11Mode.XVFB: XvfbX11Context,
+}
+
 
+def create_x11_context(mode: X11Mode, display_number: int, width: int, height: int):
     if mode == X11Mode.HOST:
         return nullcontext()
-    elif mode == X11Mode.NXAGENT:
-        return NxagentContext(**init_args)
-    elif mode == X11Mode.XEPHYR:
-        return XephyrX11Context(**init_args)
-    elif mode == X11Mode.XNEST:
-        return XnestX11Context(**init_args)
-    elif mode == X11Mode.XPRA:
-        return XpraContext(**init_args)
-    elif mode == X11Mode.XVFB:
-        return XvfbX11Context(**init_args)
+
+    context_class = _CONTEXT_CLASS_OF_MODE.get(mode)
+    if context_class is not None:
+        return context_class(display_number=display_number, width=width, height=height)
 
     assert False, f"X11 mode {mode} not supported"